@@ -3,15 +3,111 @@ from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.pdfbase.pdfmetrics import stringWidth
-import datetime
+from reportlab.lib.utils import ImageReader
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+import io
+import logging
 import os
-import re
+
+logger = logging.getLogger(__name__)
+
+_TAB_TABLE = str.maketrans({"\t": "    "})
+
+
+@lru_cache(maxsize=4096)
+def _sw(text, fontname, fontsize):
+    return stringWidth(text, fontname, fontsize)
+
+
+@lru_cache(maxsize=None)
+def _ascii_widths(fontname, fontsize):
+    # Per-codepoint widths for the 128 ASCII characters
+    return tuple(_sw(chr(i), fontname, fontsize) for i in range(128))
+
+
+def _width_measurer(text, fontname, fontsize):
+    """Return a function measuring substrings of ``text`` by summing char widths.
+
+    ASCII text (the common case) is measured straight from a precomputed
+    table; otherwise the widths of the characters in ``text`` are looked up once.
+    """
+    if text.isascii():
+        table = _ascii_widths(fontname, fontsize)
+        return lambda s: sum(map(table.__getitem__, s.encode("ascii")))
+    char_w = {ch: _sw(ch, fontname, fontsize) for ch in set(text)}
+    return lambda s: sum(map(char_w.__getitem__, s))
+
+
+@dataclass(slots=True)
+class InvoiceItems:
+    """Line items as parallel columns, with the table cells preformatted."""
+
+    descriptions: list
+    quantities: list
+    unit_prices: list
+    qty_cells: list
+    unit_cells: list
+    amount_cells: list
+
+    @classmethod
+    def from_dicts(cls, items):
+        descriptions = [item["description"] for item in items]
+        quantities = [item["quantity"] for item in items]
+        unit_prices = [item["unit_price"] for item in items]
+        amounts = [float(u) * float(q) for u, q in zip(unit_prices, quantities)]
+        return cls(
+            descriptions=descriptions,
+            quantities=quantities,
+            unit_prices=unit_prices,
+            qty_cells=[str(q) for q in quantities],
+            unit_cells=[f"{u:.2f}" for u in unit_prices],
+            amount_cells=[f"{a:.2f}" for a in amounts],
+        )
+
+
+@dataclass(slots=True)
+class PageSpec:
+    """What goes on one output page.
+
+    ``kind`` is "first" (company/customer blocks and the start of the table),
+    "continued" (more table rows) or "totals" (only the totals box and notes).
+    ``top_y`` is where the table header, or the totals box on a totals page,
+    starts.
+    """
+
+    kind: str
+    top_y: float
+    rows: list
+    totals: bool = False
+
+
+def _wrap_breaks(word_widths, space_w, indent_w, max_width):
+    # Indices of the words that start a new wrapped line. Works on widths
+    # only, so strings are joined once per output line. A first word that is
+    # too wide on its own yields an empty (indent-only) first line.
+    breaks = []
+    line_w = indent_w
+    for k, word_w in enumerate(word_widths):
+        test_w = line_w + space_w + word_w if k else indent_w + word_w
+        if test_w <= max_width:
+            line_w = test_w
+        else:
+            breaks.append(k)
+            line_w = indent_w + word_w
+    return breaks
 
 
 class ProfessionalInvoice:
     MARGIN = 0.75 * inch
     HEADER_HEIGHT = 1.2 * inch
     FOOTER_HEIGHT = 1.5 * inch
+    TOTALS_BOX_HEIGHT = 1.6 * inch
+    TABLE_HEADER_HEIGHT = 0.3 * inch
+    MIN_ROW_HEIGHT = 0.25 * inch
+    ROW_LINE_HEIGHT = 0.18 * inch
+    BACKGROUND_FORM = "page_background"
 
     PRIMARY_COLOR = colors.HexColor("#2C3E50")
     ACCENT_COLOR = colors.HexColor("#3498DB")
@@ -24,6 +120,23 @@ class ProfessionalInvoice:
         self.invoice_data = invoice_data
         self.company_data = company_data
         self.width, self.height = letter
+        self._logo_reader = self._load_logo(logo_path)
+        self._content_top = self.height - self.HEADER_HEIGHT - 0.5 * inch
+        # Lowest y that table rows and the totals box may reach
+        self._min_y = self.FOOTER_HEIGHT + inch
+        self._items = InvoiceItems.from_dicts(self.invoice_data["items"])
+
+        # Static text blocks, split once per invoice rather than once per page
+        self._footer_lines = (
+            self.company_data["footer_text"].translate(_TAB_TABLE).splitlines()
+        )
+        self._company_address_lines = [
+            line.strip() for line in self.company_data["address"].split("\n")
+        ]
+        self._customer_address_lines = [
+            line.strip()
+            for line in self.invoice_data["customer"]["address"].split("\n")
+        ]
 
         self.table_x0 = self.MARGIN
         self.table_x1 = self.width - self.MARGIN
@@ -44,6 +157,48 @@ class ProfessionalInvoice:
         # For description wrapping
         self.desc_col_width = desc_w - 0.1 * inch
 
+        # Wrapped description lines, keyed on (text, width, font, size)
+        self._split_cache = {}
+
+        # Cell anchors shared by the table header and every row
+        self._desc_x = self.col_desc + 0.05 * inch
+        self._qty_center_x = (
+            self.col_qty + 0.05 * inch + (self.col_unit_price - self.col_qty) * 0.10
+        )
+        self._unit_right_x = (
+            self.col_unit_price + (self.col_amount - self.col_unit_price) * 0.40
+        )
+        self._amt_right_x = self.col_amount + 0.15 * inch
+
+    @classmethod
+    def generate_many(cls, jobs):
+        """Render several invoices through one reused in-memory buffer.
+
+        Each job is a dict of constructor arguments (filename, logo_path,
+        invoice_data, company_data).
+        """
+        buf = io.BytesIO()
+        for job in jobs:
+            job = dict(job)
+            cls(**job)._render(buf)
+            with buf.getbuffer() as data, open(job["filename"], "wb") as f:
+                f.write(data)
+            buf.seek(0)
+            buf.truncate(0)
+
+    @staticmethod
+    def _load_logo(logo_path):
+        # Decode the logo once; drawImage reuses the reader on every page
+        if isinstance(logo_path, ImageReader):
+            return logo_path
+        if not logo_path or not os.path.exists(logo_path):
+            return None
+        try:
+            return ImageReader(logo_path)
+        except Exception as e:
+            logger.warning("Could not load logo %s: %s", logo_path, e)
+            return None
+
     def _calc_info_block_height(self, main_line, address, items=None):
         lines = 1  # main_line
         lines += len(address.split("\n"))
@@ -52,28 +207,28 @@ class ProfessionalInvoice:
         return 0.3 * inch + lines * 0.15 * inch + 0.3 * inch
 
     def _split_description(self, text, max_width, fontname="Helvetica", fontsize=9):
+        key = (text, max_width, fontname, fontsize)
+        if key in self._split_cache:
+            return self._split_cache[key]
+        text = text.translate(_TAB_TABLE)
+        measure = _width_measurer(text + " ", fontname, fontsize)
+        space_w = measure(" ")
         all_lines = []
         for physical_line in text.splitlines():
-            physical_line = physical_line.replace("\t", "    ")
-            match = re.match(r"^(\s*)", physical_line)
-            indent = match.group(1) if match else ""
-            words = physical_line.strip().split()
-            line = indent
-            for word in words:
-                test = (line + " " + word) if line.strip() else indent + word
-                if stringWidth(test, fontname, fontsize) <= max_width:
-                    line = test
-                else:
-                    all_lines.append(line)
-                    line = indent + word
-            if line or physical_line.strip() == "":
-                all_lines.append(line)
-            elif not words:
-                all_lines.append("")
+            stripped = physical_line.lstrip()
+            indent = physical_line[: len(physical_line) - len(stripped)]
+            indent_w = measure(indent)
+            words = stripped.split()
+            word_widths = [measure(word) for word in words]
+            starts = [0] + _wrap_breaks(word_widths, space_w, indent_w, max_width)
+            ends = starts[1:] + [len(words)]
+            for start, end in zip(starts, ends):
+                all_lines.append(indent + " ".join(words[start:end]))
+        self._split_cache[key] = all_lines
         return all_lines
 
-    def _draw_header(self, c, page_number, page_count):
-        c.saveState()
+    def _draw_page_background(self, c):
+        # Content shared by every page: the header band and the footer
         c.setFillColor(self.LIGHT_GRAY)
         c.rect(
             0,
@@ -83,10 +238,13 @@ class ProfessionalInvoice:
             fill=1,
             stroke=0,
         )
-        if page_number == 1 and self.logo_path and os.path.exists(self.logo_path):
+        self._draw_footer(c)
+
+    def _draw_header(self, c, page_number, page_count):
+        if page_number == 1 and self._logo_reader is not None:
             try:
                 c.drawImage(
-                    self.logo_path,
+                    self._logo_reader,
                     self.MARGIN,
                     self.height - self.HEADER_HEIGHT + 0.2 * inch,
                     width=2 * inch,
@@ -95,7 +253,7 @@ class ProfessionalInvoice:
                     preserveAspectRatio=True,
                 )
             except Exception as e:
-                print(f"Logo error: {e}")
+                logger.warning("Could not draw logo: %s", e)
 
         c.setFillColor(self.PRIMARY_COLOR)
         c.setFont("Helvetica-Bold", 16)
@@ -125,10 +283,8 @@ class ProfessionalInvoice:
             info_y - 0.45 * inch,
             f"Page {page_number}/{page_count}",
         )
-        c.restoreState()
 
     def _draw_footer(self, c):
-        c.saveState()
         footer_y = self.FOOTER_HEIGHT - 0.5 * inch
         c.setStrokeColor(self.BORDER_COLOR)
         c.setLineWidth(1)
@@ -137,20 +293,13 @@ class ProfessionalInvoice:
         c.setFont("Helvetica", 7)
         c.setFillColor(colors.black)
 
-        # Your desired multiline footer text:
-        footer_text = self.company_data["footer_text"]
-        lines = footer_text.replace("\t", "    ").splitlines()
-
         y = footer_y - 0.3 * inch  # Adjust as needed for vertical position
         line_height = 0.16 * inch
-        for line in lines:
+        for line in self._footer_lines:
             c.drawCentredString(self.width / 2, y, line)
             y -= line_height
 
-        c.restoreState()
-
     def _draw_company_info(self, c, y_position):
-        c.saveState()
         c.setFillColor(self.PRIMARY_COLOR)
         c.setFont("Helvetica-Bold", 12)
         c.drawString(self.MARGIN, y_position, "FROM:")
@@ -158,20 +307,20 @@ class ProfessionalInvoice:
         c.setFont("Helvetica-Bold", 11)
         y = y_position - 0.3 * inch
         c.drawString(self.MARGIN, y, self.company_data["name"])
-        c.setFont("Helvetica", 10)
         y -= 0.2 * inch
-        address_lines = self.company_data["address"].split("\n")
-        for line in address_lines:
-            c.drawString(self.MARGIN, y, line.strip())
-            y -= 0.15 * inch
-        c.drawString(self.MARGIN, y, f"Phone: {self.company_data['phone']}")
-        y -= 0.15 * inch
-        c.drawString(self.MARGIN, y, f"Email: {self.company_data['email']}")
-        c.restoreState()
+        text = c.beginText(self.MARGIN, y)
+        text.setFont("Helvetica", 10, leading=0.15 * inch)
+        text.textLines(
+            self._company_address_lines
+            + [
+                f"Phone: {self.company_data['phone']}",
+                f"Email: {self.company_data['email']}",
+            ]
+        )
+        c.drawText(text)
 
     def _draw_customer_info(self, c, y_position):
         cust = self.invoice_data["customer"]
-        c.saveState()
         c.setFillColor(self.PRIMARY_COLOR)
         c.setFont("Helvetica-Bold", 12)
         c.drawString(self.width / 2, y_position, "BILL TO:")
@@ -179,20 +328,17 @@ class ProfessionalInvoice:
         c.setFont("Helvetica-Bold", 11)
         y = y_position - 0.3 * inch
         c.drawString(self.width / 2, y, cust["name"])
-        c.setFont("Helvetica", 10)
         y -= 0.2 * inch
-        address_lines = cust["address"].split("\n")
-        for line in address_lines:
-            c.drawString(self.width / 2, y, line.strip())
-            y -= 0.15 * inch
-        c.drawString(self.width / 2, y, f"Phone: {cust.get('phone', '')}")
-        y -= 0.15 * inch
-        c.drawString(self.width / 2, y, f"Email: {cust.get('email', '')}")
-        c.restoreState()
+        text = c.beginText(self.width / 2, y)
+        text.setFont("Helvetica", 10, leading=0.15 * inch)
+        text.textLines(
+            self._customer_address_lines
+            + [f"Phone: {cust.get('phone', '')}", f"Email: {cust.get('email', '')}"]
+        )
+        c.drawText(text)
 
     def _draw_table_header(self, c, y_position):
-        c.saveState()
-        header_height = 0.3 * inch
+        header_height = self.TABLE_HEADER_HEIGHT
         c.setFillColor(self.PRIMARY_COLOR)
         c.rect(
             self.table_x0,
@@ -205,51 +351,54 @@ class ProfessionalInvoice:
         c.setFillColor(colors.white)
         c.setFont("Helvetica-Bold", 10)
         header_y = y_position - 0.2 * inch
-        c.drawString(self.col_desc + 0.05 * inch, header_y, "DESCRIPTION")
-        c.drawCentredString(
-            self.col_qty + 0.05 * inch + (self.col_unit_price - self.col_qty) * 0.10,
-            header_y,
-            "QTY",
-        )
-        c.drawRightString(
-            self.col_unit_price + (self.col_amount - self.col_unit_price) * 0.40,
-            header_y,
-            "UNIT PRICE",
-        )
-        c.drawRightString(self.col_amount + 0.15 * inch, header_y, "AMOUNT")
-        c.restoreState()
+        c.drawString(self._desc_x, header_y, "DESCRIPTION")
+        c.drawCentredString(self._qty_center_x, header_y, "QTY")
+        c.drawRightString(self._unit_right_x, header_y, "UNIT PRICE")
+        c.drawRightString(self._amt_right_x, header_y, "AMOUNT")
         return y_position - header_height
 
     def _paginate_table_rows(self, y_position):
-        items = self.invoice_data["items"]
-        min_y = self.FOOTER_HEIGHT + inch
+        descriptions = self._items.descriptions
+        min_y = self._min_y
+        line_h = self.ROW_LINE_HEIGHT
+        min_row_h = self.MIN_ROW_HEIGHT
         pages = []
         current_y = y_position
         page_items = []
-        i = 0
-        while i < len(items):
-            item = items[i]
+        for i, description in enumerate(descriptions):
             desc_lines = self._split_description(
-                item["description"],
+                description,
                 self.desc_col_width,
                 fontname="Helvetica",
                 fontsize=9,
             )
-            row_height = max(0.25 * inch, 0.18 * inch * len(desc_lines))
+            n_lines = len(desc_lines)
+            row_height = line_h * n_lines if n_lines >= 2 else min_row_h
             if current_y - row_height < min_y and page_items:
                 pages.append((y_position, page_items.copy()))
                 page_items = []
                 current_y = y_position
-            page_items.append((item, desc_lines, row_height))
+            page_items.append((i, desc_lines, row_height))
             current_y -= row_height
-            i += 1
         if page_items:
             pages.append((y_position, page_items.copy()))
         return pages
 
     def _table_rows_drawer(self, c, page_y, items_desc_lines):
         y_position = page_y
-        for i, (item, desc_lines, row_height) in enumerate(items_desc_lines):
+        desc_x = self._desc_x
+        qty_x = self._qty_center_x
+        unit_x = self._unit_right_x
+        amt_x = self._amt_right_x
+        desc_offset = 0.15 * inch
+        leading = self.ROW_LINE_HEIGHT
+        half_line = 0.09 * inch
+        c.setFillColor(colors.black)
+        c.setFont("Helvetica", 9)
+        qty_cells = self._items.qty_cells
+        unit_cells = self._items.unit_cells
+        amount_cells = self._items.amount_cells
+        for i, (idx, desc_lines, row_height) in enumerate(items_desc_lines):
             if i % 2 == 0:
                 c.setFillColor(self.LIGHT_GRAY)
                 c.rect(
@@ -260,101 +409,83 @@ class ProfessionalInvoice:
                     fill=1,
                     stroke=0,
                 )
-            c.setFillColor(colors.black)
-            c.setFont("Helvetica", 9)
-            for j, line in enumerate(desc_lines):
-                text_y = y_position - 0.15 * inch - j * 0.18 * inch
-                c.drawString(self.col_desc + 0.05 * inch, text_y, line)
-            cell_y = (
-                y_position - row_height / 2 + 0.09 * inch * (len(desc_lines) - 1) / 2
-            )
-            c.drawCentredString(
-                self.col_qty
-                + 0.05 * inch
-                + (self.col_unit_price - self.col_qty) * 0.10,
-                cell_y,
-                str(item["quantity"]),
-            )
-            c.drawRightString(
-                self.col_unit_price + (self.col_amount - self.col_unit_price) * 0.40,
-                cell_y,
-                f"{item['unit_price']:.2f}",
-            )
-            amount = float(item["unit_price"]) * float(item["quantity"])
-            c.drawRightString(self.col_amount + 0.15 * inch, cell_y, f"{amount:.2f}")
+                c.setFillColor(colors.black)
+            desc = c.beginText(desc_x, y_position - desc_offset)
+            desc.setFont("Helvetica", 9, leading=leading)
+            desc.textLines(desc_lines)
+            c.drawText(desc)
+            cell_y = y_position - row_height / 2 + half_line * (len(desc_lines) - 1) / 2
+            c.drawCentredString(qty_x, cell_y, qty_cells[idx])
+            c.drawRightString(unit_x, cell_y, unit_cells[idx])
+            c.drawRightString(amt_x, cell_y, amount_cells[idx])
             y_position -= row_height
         c.setStrokeColor(self.BORDER_COLOR)
         c.setLineWidth(1)
         c.line(self.table_x0, y_position, self.table_x1, y_position)
         return y_position - 0.3 * inch
 
+    def _measure_end_y(self, page_y, items_desc_lines):
+        # Same end position as _table_rows_drawer, without drawing anything
+        return page_y - sum(rh for _, _, rh in items_desc_lines) - 0.3 * inch
+
+    def _totals_fit(self, y_position):
+        return y_position - self.TOTALS_BOX_HEIGHT >= self._min_y
+
     def _draw_totals_section(self, c, y_position):
-        c.saveState()
+        if not self._totals_fit(y_position):
+            return False, y_position
+
+        d = self.invoice_data
         box_width = 2.5 * inch
-        box_height = 1.6 * inch
+        box_height = self.TOTALS_BOX_HEIGHT
         box_x = self.width - self.MARGIN - box_width
-        min_y = self.FOOTER_HEIGHT + inch
-        if y_position - box_height < min_y:
-            c.restoreState()
-            return False, y_position
+        left = box_x + 0.2 * inch
+        right = box_x + box_width - 0.2 * inch
+        row_step = 0.2 * inch
+        draw_l = c.drawString
+        draw_r = c.drawRightString
 
         c.setFillColor(self.LIGHT_GRAY)
         c.setStrokeColor(self.BORDER_COLOR)
+        c.setLineWidth(1)
         c.rect(box_x, y_position - box_height, box_width, box_height, fill=1, stroke=1)
         c.setFillColor(colors.black)
         y = y_position - 0.3 * inch
         c.setFont("Helvetica", 10)
-        c.drawString(box_x + 0.2 * inch, y, "Subtotal:")
-        c.drawRightString(
-            box_x + box_width - 0.2 * inch, y, f"{self.invoice_data['subtotal']:.2f}"
-        )
-        y -= 0.2 * inch
+        draw_l(left, y, "Subtotal:")
+        draw_r(right, y, f"{d['subtotal']:.2f}")
+        y -= row_step
 
-        if self.invoice_data.get("discount_amount", 0):
-            c.drawString(box_x + 0.2 * inch, y, "Discount:")
-            c.drawRightString(
-                box_x + box_width - 0.2 * inch,
-                y,
-                f"-{self.invoice_data['discount_amount']:.2f}",
-            )
-            y -= 0.2 * inch
+        discount_amount = d.get("discount_amount", 0)
+        if discount_amount:
+            draw_l(left, y, "Discount:")
+            draw_r(right, y, f"-{discount_amount:.2f}")
+            y -= row_step
 
-        if self.invoice_data.get("timbre", 0):
-            c.drawString(box_x + 0.2 * inch, y, "Timbre:")
-            c.drawRightString(
-                box_x + box_width - 0.2 * inch, y, f"{self.invoice_data['timbre']:.2f}"
-            )
-            y -= 0.2 * inch
+        timbre = d.get("timbre", 0)
+        if timbre:
+            draw_l(left, y, "Timbre:")
+            draw_r(right, y, f"{timbre:.2f}")
+            y -= row_step
 
-        c.drawString(
-            box_x + 0.2 * inch, y, f"Tax ({self.invoice_data['tax_percent']}%):"
-        )
-        c.drawRightString(
-            box_x + box_width - 0.2 * inch, y, f"{self.invoice_data['tax_amount']:.2f}"
-        )
+        draw_l(left, y, f"Tax ({d['tax_percent']}%):")
+        draw_r(right, y, f"{d['tax_amount']:.2f}")
 
         y -= 0.15 * inch
         c.setStrokeColor(self.PRIMARY_COLOR)
-        c.setLineWidth(1)
         c.line(box_x + 0.1 * inch, y, box_x + box_width - 0.1 * inch, y)
         y -= 0.25 * inch
         c.setFont("Helvetica-Bold", 12)
         c.setFillColor(self.PRIMARY_COLOR)
-        c.drawString(box_x + 0.2 * inch, y, "TOTAL:")
-        c.drawRightString(
-            box_x + box_width - 0.2 * inch,
-            y,
-            f"{self.invoice_data['total_amount']:.2f}",
-        )
-        c.restoreState()
+        draw_l(left, y, "TOTAL:")
+        draw_r(right, y, f"{d['total_amount']:.2f}")
         return True, y_position - box_height - 0.5 * inch
 
     def _draw_notes_section(self, c, y_position):
-        c.saveState()
         notes = self.invoice_data.get("notes", "")
         if notes:
             # Normalize tabs to spaces
-            notes = notes.replace("\t", "    ")
+            notes = notes.translate(_TAB_TABLE)
             notes_lines = notes.splitlines()
             c.setFont("Helvetica", 9)
             c.setFillColor(colors.black)
@@ -363,7 +494,9 @@ class ProfessionalInvoice:
             max_width = self.width - 2 * self.MARGIN
 
             fontname, fontsize = "Helvetica", 9
-            label_width = stringWidth(notes_label, fontname, fontsize)
+            label_width = _sw(notes_label, fontname, fontsize)
+            measure = _width_measurer(notes + " ", fontname, fontsize)
+            space_w = measure(" ")
 
             def wrap_line(line, is_first_paragraph_line):
                 """
@@ -376,20 +509,22 @@ class ProfessionalInvoice:
                 effective_width = max_width if not prefix else (max_width - label_width)
                 words = line.lstrip().split() if prefix else line.split()
                 current = ""
-                first = True
-                while words:
-                    word = words.pop(0)
-                    sep = " " if current else ""
-                    candidate = current + sep + word
-                    width = stringWidth(candidate, fontname, fontsize)
+                current_w = 0.0
+                for word in words:
+                    word_w = measure(word)
+                    if current:
+                        candidate = current + " " + word
+                        width = current_w + space_w + word_w
+                    else:
+                        candidate, width = word, word_w
                     if width > effective_width and current:
                         # Output current and start again with word
                         out.append(prefix + current)
-                        current = word
+                        current, current_w = word, word_w
                         prefix = ""
                         effective_width = max_width
                     else:
-                        current = candidate
+                        current, current_w = candidate, width
                 # last line
                 if current or not out:
                     out.append(prefix + current)
@@ -403,10 +538,27 @@ class ProfessionalInvoice:
                     note_y -= 0.15 * inch
                 is_first_physical_line = False
             y_position = note_y
-        c.restoreState()
         return y_position
 
     def generate_invoice(self):
+        """Render the invoice and write it to ``self.filename``, if set.
+
+        The PDF is built in memory and written with a single write; its bytes
+        are returned so callers don't need to read the file back.
+        """
+        buf = io.BytesIO()
+        self._render(buf)
+        if self.filename:
+            with buf.getbuffer() as data, open(self.filename, "wb") as f:
+                f.write(data)
+        return buf.getvalue()
+
+    def _plan_pages(self):
+        """Lay out every page before drawing anything.
+
+        Returns one PageSpec per output page. The totals box goes on the last
+        table page when it fits below the rows, otherwise on a page of its own.
+        """
         company_h = self._calc_info_block_height(
             self.company_data["name"],
             self.company_data["address"],
@@ -422,53 +574,106 @@ class ProfessionalInvoice:
             items=[cust.get("phone", ""), cust.get("email", "")],
         )
         block_h = max(company_h, customer_h)
-        y_position = self.height - self.HEADER_HEIGHT - 0.5 * inch
-        table_start_y = y_position - block_h - 0.5 * inch
-        table_pages = self._paginate_table_rows(table_start_y)
-        page_count = len(table_pages)
-        dummy_canvas = canvas.Canvas(None, pagesize=letter)
-        y_test = self._table_rows_drawer(
-            dummy_canvas, table_pages[-1][0], table_pages[-1][1]
+        table_start_y = self._content_top - block_h - 0.5 * inch
+        table_pages = self._paginate_table_rows(table_start_y) or [(table_start_y, [])]
+
+        specs = [PageSpec("first", table_start_y, table_pages[0][1])]
+        for _, rows in table_pages[1:]:
+            specs.append(PageSpec("continued", self._content_top, rows))
+
+        last = specs[-1]
+        rows_end_y = self._measure_end_y(
+            last.top_y - self.TABLE_HEADER_HEIGHT, last.rows
         )
-        can_fit, notes_y_ct = self._draw_totals_section(dummy_canvas, y_test)
-        if not can_fit:
-            page_count += 1
-
-        c = canvas.Canvas(self.filename, pagesize=letter)
-        page_number = 1
-
-        for pi, (page_y, items_desc_lines) in enumerate(table_pages):
-            self._draw_header(c, page_number, page_count)
-            self._draw_footer(c)
-            y = y_position
-            if page_number == 1:
-                self._draw_company_info(c, y_position)
-                self._draw_customer_info(c, y_position)
-                rows_start_y = page_y
-            else:
-                rows_start_y = self.height - self.HEADER_HEIGHT - 0.5 * inch
-                rows_start_y = self._draw_table_header(c, rows_start_y)
-            if page_number == 1:
-                rows_start_y = self._draw_table_header(c, rows_start_y)
-            y_end = self._table_rows_drawer(c, rows_start_y, items_desc_lines)
-            if pi == len(table_pages) - 1:
-                success, notes_y = self._draw_totals_section(c, y_end)
-                if success:
-                    self._draw_notes_section(c, notes_y)
-                else:
-                    c.showPage()
-                    page_number += 1
-                    self._draw_header(c, page_number, page_count)
-                    self._draw_footer(c)
-                    y_totals = self.height - self.HEADER_HEIGHT - 0.5 * inch
-                    success, notes_y = self._draw_totals_section(c, y_totals)
-                    self._draw_notes_section(c, notes_y)
-            if pi != len(table_pages) - 1:
+        if self._totals_fit(rows_end_y):
+            last.totals = True
+        else:
+            specs.append(PageSpec("totals", self._content_top, [], totals=True))
+        return specs
+
+    def _render_page(self, c, spec, page_number, page_count):
+        # One graphics-state scope per page; the draw helpers set every
+        # attribute they rely on, so they don't save/restore individually.
+        c.saveState()
+        c.doForm(self.BACKGROUND_FORM)
+        self._draw_header(c, page_number, page_count)
+        y = spec.top_y
+        if spec.kind == "first":
+            self._draw_company_info(c, self._content_top)
+            self._draw_customer_info(c, self._content_top)
+        if spec.kind != "totals":
+            y = self._draw_table_header(c, y)
+            y = self._table_rows_drawer(c, y, spec.rows)
+        if spec.totals:
+            _, notes_y = self._draw_totals_section(c, y)
+            self._draw_notes_section(c, notes_y)
+        c.restoreState()
+
+    def _render(self, out):
+        specs = self._plan_pages()
+        c = canvas.Canvas(out, pagesize=letter)
+        # Stored once as a form XObject; each page references it with doForm
+        c.beginForm(self.BACKGROUND_FORM)
+        self._draw_page_background(c)
+        c.endForm()
+        for page_number, spec in enumerate(specs, start=1):
+            if page_number > 1:
                 c.showPage()
-                page_number += 1
+            self._render_page(c, spec, page_number, len(specs))
         c.save()
 
 
+# Logo bytes keyed by path, installed once in each worker process
+_worker_logos = {}
+
+
+def _init_worker(logos):
+    _worker_logos.update(logos)
+
+
+def render_job(job):
+    """Render one job in a pool worker.
+
+    Returns the written filename, or the PDF bytes when the job has none.
+    """
+    job = dict(job)
+    logo = _worker_logos.get(job.get("logo_path"))
+    if logo is not None:
+        job["logo_path"] = ImageReader(io.BytesIO(logo))
+    pdf = ProfessionalInvoice(**job).generate_invoice()
+    return job["filename"] or pdf
+
+
+def create_render_pool(logo_paths=(), workers=None, mp_context=None):
+    """Start a process pool for ``render_job``.
+
+    Logo files are read once here and shipped to each worker rather than
+    being reopened for every invoice.
+    """
+    logos = {}
+    for path in logo_paths:
+        if path and path not in logos and os.path.exists(path):
+            with open(path, "rb") as f:
+                logos[path] = f.read()
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp_context,
+        initializer=_init_worker,
+        initargs=(logos,),
+    )
+
+
+def generate_invoices_parallel(jobs, workers=None):
+    """Render invoices across a process pool.
+
+    Each job is a dict of ProfessionalInvoice constructor arguments.
+    Returns the written filenames.
+    """
+    logo_paths = [job.get("logo_path") for job in jobs]
+    with create_render_pool(logo_paths, workers) as executor:
+        return list(executor.map(render_job, jobs))
+
+
 if __name__ == "__main__":
     company_data = {
         "name": "Tech Solutions Inc.",
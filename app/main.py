@@ -1,40 +1,118 @@
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, Field
+import asyncio
+import hashlib
+import json
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, suppress
+import logging
+import multiprocessing
+import os
+import statistics
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+from fastapi import (
+    BackgroundTasks,
+    FastAPI,
+    HTTPException,
+    Depends,
+    Query,
+    Response,
+    status,
+)
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 from datetime import datetime, timedelta
 from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-from jose import JWTError, jwt
+from fastapi.middleware.gzip import GZipMiddleware
+import jwt
+from jwt import InvalidTokenError
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
-from app.invoice_generator import ProfessionalInvoice
-
+from app.invoice_generator import create_render_pool, render_job
 
 # SQLAlchemy imports
 from sqlalchemy import (
-    create_engine,
     Column,
+    Computed,
     Integer,
     String,
     Float,
     ForeignKey,
+    Index,
     Text,
     Boolean,
     UniqueConstraint,
+    bindparam,
+    delete,
+    event,
+    func,
+    select,
+    update,
 )
 
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, Session, joinedload
+from sqlalchemy.orm import relationship, joinedload, raiseload, selectinload
 
+logger = logging.getLogger(__name__)
 
-SECRET_KEY = "J7sn8fg"  # Change this for production!
+# Tokens are signed with JWT_SECRET; encoded once here so jwt.encode/decode
+# get bytes directly.
+if not os.environ.get("JWT_SECRET"):
+    raise RuntimeError("The JWT_SECRET environment variable must be set")
+SECRET_KEY = os.environ["JWT_SECRET"].encode("utf-8")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Argon2id for new hashes (OWASP: 46 MiB, t=2, p=1); bcrypt stays so
+# existing hashes still verify and get upgraded on the next login.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__memory_cost=47104,
+    argon2__time_cost=2,
+    argon2__parallelism=1,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Argon2 time_cost is calibrated at startup so one hash takes roughly this
+# long on the host, but never drops below the OWASP baseline of 2.
+PASSWORD_HASH_TARGET_SECONDS = 0.25
+ARGON2_MIN_TIME_COST = 2
+ARGON2_MAX_TIME_COST = 32
+
+
+def _argon2_hash_latency(time_cost, samples=3):
+    ctx = CryptContext(
+        schemes=["argon2"],
+        argon2__memory_cost=47104,
+        argon2__time_cost=time_cost,
+        argon2__parallelism=1,
+    )
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        ctx.hash("calibration")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def _calibrate_argon2_time_cost():
+    # Smallest time_cost whose median hash time reaches the target
+    low, high = ARGON2_MIN_TIME_COST, ARGON2_MAX_TIME_COST
+    while low < high:
+        mid = (low + high) // 2
+        if _argon2_hash_latency(mid) < PASSWORD_HASH_TARGET_SECONDS:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -54,23 +132,99 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-app = FastAPI()
+def create_missing_indexes(conn):
+    # create_all skips tables that already exist, so indexes added to the
+    # models later are created here (CREATE INDEX IF NOT EXISTS).
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(conn, checkfirst=True)
+            except IntegrityError as e:
+                logger.warning("Could not create index %s: %s", index.name, e.orig)
+
+
+def migrate_invoice_item_totals(conn):
+    # invoice_items.total used to be a plain column filled in by the API.
+    # SQLite can't turn a column into a generated one in place, so older
+    # tables are rebuilt once with the current definition.
+    columns = conn.exec_driver_sql("PRAGMA table_xinfo(invoice_items)").all()
+    # table_xinfo marks generated columns with hidden = 2 (virtual) or 3 (stored)
+    if any(column[1] == "total" and column[6] in (2, 3) for column in columns):
+        return
+    conn.exec_driver_sql("ALTER TABLE invoice_items RENAME TO invoice_items_old")
+    for index in conn.exec_driver_sql("PRAGMA index_list(invoice_items_old)").all():
+        if index[3] == "c":
+            conn.exec_driver_sql(f'DROP INDEX "{index[1]}"')
+    DBInvoiceItem.__table__.create(conn)
+    conn.exec_driver_sql(
+        "INSERT INTO invoice_items"
+        " (id, invoice_id, product_id, description, unit_price, quantity)"
+        " SELECT id, invoice_id, product_id, description, unit_price, quantity"
+        " FROM invoice_items_old"
+    )
+    conn.exec_driver_sql("DROP TABLE invoice_items_old")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate_invoice_item_totals)
+        await conn.run_sync(create_missing_indexes)
+    await configure_password_hashing()
+    await create_default_superuser()
+    await create_default_settings()
+    await start_pdf_render_pool()
+    yield
+    pdf_render_pool.shutdown()
 
+
+app = FastAPI(lifespan=lifespan)
+
+# Comma-separated list of allowed frontend origins, e.g.
+# CORS_ORIGINS="https://app.example.com,http://localhost:3000"
 origins = [
-    "*",
+    origin.strip()
+    for origin in os.environ.get("CORS_ORIGINS", "").split(",")
+    if origin.strip()
 ]
+if not origins:
+    logger.warning("CORS_ORIGINS is not set; cross-origin requests will be rejected")
+
+# Large JSON lists (invoices nest full products) compress very well.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,
 )
 
-DATABASE_URL = "sqlite:///./database/invoice_db.db"
+DATABASE_URL = "sqlite+aiosqlite:///./database/invoice_db.db"
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 30},
+    pool_recycle=3600,
+)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside a writer; NORMAL sync is safe under WAL
+    # and avoids an fsync per commit.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.close()
+
+
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -101,10 +255,10 @@ class DBProduct(Base):
 class DBInvoice(Base):
     __tablename__ = "invoices"
     id = Column(Integer, primary_key=True, index=True)
-    invoice_number = Column(String, nullable=False)
+    invoice_number = Column(String, nullable=False, unique=True, index=True)
     invoice_date = Column(String, nullable=False)
     due_date = Column(String, nullable=False)
-    customer_id = Column(Integer, ForeignKey("customers.id"))
+    customer_id = Column(Integer, ForeignKey("customers.id"), index=True)
     subtotal = Column(Float, nullable=False)
     discount_type = Column(String, default="percent")  # "percent" or "fixed"
     discount_value = Column(Float, default=0.0)
@@ -125,14 +279,18 @@ class DBInvoiceItem(Base):
     __tablename__ = "invoice_items"
     id = Column(Integer, primary_key=True, index=True)
     invoice_id = Column(Integer, ForeignKey("invoices.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     description = Column(String, nullable=True)
     unit_price = Column(Float, nullable=True)
     quantity = Column(Integer, nullable=False)
-    total = Column(Float, nullable=False)
+    total = Column(Float, Computed("quantity * unit_price", persisted=True))
     invoice = relationship("DBInvoice", back_populates="items")
 
     product = relationship("DBProduct", back_populates="invoice_items")
+    # Also serves lookups by invoice_id alone (leftmost column)
+    __table_args__ = (
+        Index("ix_invoice_items_invoice_product", "invoice_id", "product_id"),
+    )
 
 
 class DBSetting(Base):
@@ -143,9 +301,51 @@ class DBSetting(Base):
     __table_args__ = (UniqueConstraint("key", name="unique_setting_key"),)
 
 
-def create_default_settings():
-    db = SessionLocal()
+# Settings change rarely, so values are kept in process memory for a short
+# while. Writes through the API drop the key at once in this process; other
+# workers pick the new value up when their entry expires. Each invalidation
+# bumps the generation, so a read that started before it doesn't put the old
+# value back.
+SETTINGS_CACHE_TTL_SECONDS = 30
+_settings_cache: dict[str, tuple[str, float]] = {}
+_settings_generation = 0
+_settings_lock = threading.Lock()
+
+
+async def get_settings(db: AsyncSession, keys: List[str]) -> dict[str, str]:
+    now = time.monotonic()
+    with _settings_lock:
+        cached = {
+            key: entry[0]
+            for key in keys
+            if (entry := _settings_cache.get(key)) is not None and entry[1] > now
+        }
+        generation = _settings_generation
+    misses = [key for key in keys if key not in cached]
+    if misses:
+        rows = (
+            await db.execute(
+                select(DBSetting.key, DBSetting.value).where(DBSetting.key.in_(misses))
+            )
+        ).all()
+        fetched = dict(rows)
+        expires_at = time.monotonic() + SETTINGS_CACHE_TTL_SECONDS
+        with _settings_lock:
+            if generation == _settings_generation:
+                for key, value in fetched.items():
+                    _settings_cache[key] = (value, expires_at)
+        cached.update(fetched)
+    return cached
+
 
+def invalidate_setting(key: str):
+    global _settings_generation
+    with _settings_lock:
+        _settings_generation += 1
+        _settings_cache.pop(key, None)
+
+
+async def create_default_settings():
     settings = {
         "company_name": "comp-1",
         "company_address": "address of comp-1",
@@ -157,16 +357,14 @@ def create_default_settings():
         www.techsolutions.come""",
     }
 
-    for x, y in settings.items():
-        db_setting = DBSetting(key=x, value=y)
-        db.add(db_setting)
-        try:
-            db.commit()
-
-            db.close()
-
-        except Exception as e:
-            db.rollback()
+    rows = [{"key": x, "value": y} for x, y in settings.items()]
+    async with SessionLocal() as db:
+        await db.execute(
+            sqlite_insert(DBSetting)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["key"])
+        )
+        await db.commit()
 
 
 class DBCustomer(Base):
@@ -179,31 +377,77 @@ class DBCustomer(Base):
     invoices = relationship("DBInvoice", back_populates="customer")
 
 
-def create_default_superuser():
-    db = SessionLocal()
+# Lookups run on most requests are built once; callers pass the value as a
+# bound parameter instead of constructing the statement each time.
+USER_BY_ID = select(DBUser).where(DBUser.id == bindparam("user_id"))
+USER_BY_USERNAME = select(DBUser).where(DBUser.username == bindparam("username"))
+PRODUCT_BY_ID = select(DBProduct).where(DBProduct.id == bindparam("product_id"))
+CUSTOMER_BY_ID = select(DBCustomer).where(DBCustomer.id == bindparam("customer_id"))
+SETTING_BY_KEY = select(DBSetting).where(DBSetting.key == bindparam("key"))
+
+
+# Settings the app keeps for itself; the settings API neither lists nor
+# accepts them.
+ARGON2_TIME_COST_KEY = "argon2_time_cost"
+INTERNAL_SETTING_KEYS = {ARGON2_TIME_COST_KEY}
+
+
+def _parse_argon2_time_cost(value):
+    try:
+        time_cost = int(value)
+    except (TypeError, ValueError):
+        return None
+    if ARGON2_MIN_TIME_COST <= time_cost <= ARGON2_MAX_TIME_COST:
+        return time_cost
+    return None
+
+
+async def configure_password_hashing():
+    # The calibrated cost is stored as a setting so every worker, and every
+    # restart, hashes with the same parameters.
+    key = ARGON2_TIME_COST_KEY
+    async with SessionLocal() as db:
+        setting = await db.scalar(SETTING_BY_KEY, {"key": key})
+        time_cost = _parse_argon2_time_cost(setting.value) if setting else None
+        if time_cost is None:
+            if setting is not None:
+                logger.warning("Recalibrating invalid %s %r", key, setting.value)
+            # Calibration hashes for a few seconds; keep it off the event loop
+            time_cost = await asyncio.to_thread(_calibrate_argon2_time_cost)
+            if setting is None:
+                db.add(DBSetting(key=key, value=str(time_cost)))
+            else:
+                setting.value = str(time_cost)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Another worker calibrated first; use its value
+                await db.rollback()
+                setting = await db.scalar(SETTING_BY_KEY, {"key": key})
+                time_cost = _parse_argon2_time_cost(setting.value) or time_cost
+    pwd_context.update(argon2__time_cost=time_cost)
+
+
+async def create_default_superuser():
     username = "admin"
     email = "admin@tt.com"
     password = "admin"  # CHANGE THIS IN PRODUCTION
 
-    existing = db.query(DBUser).filter(DBUser.username == username).first()
-    if not existing:
-        superuser = DBUser(
-            username=username,
-            email=email,
-            hashed_password=get_password_hash(password),
-            is_active=True,
-            is_superuser=True,
-        )
-        db.add(superuser)
-        db.commit()
-        print(f"Created default superuser: {username}/{password}")
-    db.close()
-
+    async with SessionLocal() as db:
+        existing = await db.scalar(USER_BY_USERNAME, {"username": username})
+        if not existing:
+            superuser = DBUser(
+                username=username,
+                email=email,
+                hashed_password=await asyncio.to_thread(get_password_hash, password),
+                is_active=True,
+                is_superuser=True,
+            )
+            db.add(superuser)
+            await db.commit()
+            logger.info("Created default superuser %s", username)
 
-Base.metadata.create_all(bind=engine)
 
-create_default_superuser()
-create_default_settings()
 # --- Pydantic Models ---
 
 
@@ -220,8 +464,7 @@ class UserOut(BaseModel):
     is_active: bool
     is_superuser: bool
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ProductBase(BaseModel):
@@ -243,8 +486,7 @@ class ProductUpdate(BaseModel):
 class Product(ProductBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class InvoiceItemBase(BaseModel):
@@ -271,10 +513,15 @@ class InvoiceItem(InvoiceItemBase):
     invoice_id: int
     product_id: int
     name: Optional[str] = None
-    product: Product
+    # None once the product has been deleted
+    product: Optional[Product] = None
+
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        from_attributes = True
+    @model_validator(mode="after")
+    def set_name_from_product(self):
+        self.name = self.product.name if self.product else None
+        return self
 
 
 class InvoiceBase(BaseModel):
@@ -335,8 +582,7 @@ class CustomerUpdate(BaseModel):
 class Customer(CustomerBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class Invoice(InvoiceBase):
@@ -345,11 +591,11 @@ class Invoice(InvoiceBase):
     discount_amount: float
     tax_amount: float
     total_amount: float
-    customer: Customer
+    # None once the customer has been deleted
+    customer: Optional[Customer] = None
     items: List[InvoiceItem]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class SettingBase(BaseModel):
@@ -364,33 +610,236 @@ class SettingCreate(SettingBase):
 class Setting(SettingBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class Settings(SettingBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # --- Dependency to get the database session ---
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(DBUser).filter(DBUser.username == username).first()
+async def get_user_by_username(db: AsyncSession, username: str):
+    return await db.scalar(USER_BY_USERNAME, {"username": username})
+
+
+# With FATOURA_STRICT_LOADS=1 (CI, development) any relationship the invoice
+# queries don't load explicitly raises instead of being fetched lazily.
+STRICT_LOADS = os.environ.get("FATOURA_STRICT_LOADS") == "1"
+
+
+def invoice_load_options():
+    # Async sessions can't lazy load, so everything the Invoice schema reads
+    # (customer, items and their products) is loaded up front.
+    options = [
+        joinedload(DBInvoice.customer),
+        selectinload(DBInvoice.items).selectinload(DBInvoiceItem.product),
+    ]
+    if STRICT_LOADS:
+        options.append(raiseload("*"))
+    return options
+
+
+INVOICE_WITH_ITEMS = (
+    select(DBInvoice)
+    .options(*invoice_load_options())
+    .where(DBInvoice.id == bindparam("invoice_id"))
+    .execution_options(populate_existing=True)
+)
+
+
+async def get_invoice_with_items(db: AsyncSession, invoice_id: int):
+    result = await db.execute(INVOICE_WITH_ITEMS, {"invoice_id": invoice_id})
+    return result.scalar_one_or_none()
+
+
+def schema_columns(schema, model):
+    """Columns of ``model``'s table that ``schema`` exposes, in field order."""
+    table = model.__table__
+    return [table.c[name] for name in schema.model_fields if name in table.c]
+
+
+def schema_dict(schema, obj):
+    """Column values of ORM object ``obj`` for the fields ``schema`` exposes."""
+    return {
+        column.key: getattr(obj, column.key)
+        for column in schema_columns(schema, type(obj))
+    }
+
+
+async def list_invoice_rows(db: AsyncSession):
+    """Every invoice as a plain dict shaped like the Invoice schema.
+
+    Read with two Core joins (invoices with customers, items with products)
+    and assembled in Python, skipping ORM hydration and model validation.
+    """
+    customer_columns = schema_columns(Customer, DBCustomer)
+    invoice_rows = await db.execute(
+        select(
+            *schema_columns(Invoice, DBInvoice),
+            *(column.label(f"customer.{column.name}") for column in customer_columns),
+        )
+        .select_from(DBInvoice)
+        .outerjoin(DBCustomer, DBInvoice.customer_id == DBCustomer.id)
+        .order_by(DBInvoice.id)
+    )
+    invoices = {}
+    for row in invoice_rows.mappings():
+        invoice = {
+            key: value for key, value in row.items() if not key.startswith("customer.")
+        }
+        customer = {
+            column.name: row[f"customer.{column.name}"] for column in customer_columns
+        }
+        invoice["customer"] = customer if customer["id"] is not None else None
+        invoice["items"] = []
+        invoices[invoice["id"]] = invoice
+
+    product_columns = schema_columns(Product, DBProduct)
+    item_rows = await db.execute(
+        select(
+            *schema_columns(InvoiceItem, DBInvoiceItem),
+            *(column.label(f"product.{column.name}") for column in product_columns),
+        )
+        .select_from(DBInvoiceItem)
+        .outerjoin(DBProduct, DBInvoiceItem.product_id == DBProduct.id)
+        .order_by(DBInvoiceItem.id)
+    )
+    for row in item_rows.mappings():
+        invoice = invoices.get(row["invoice_id"])
+        if invoice is None:
+            continue
+        item = {
+            key: value for key, value in row.items() if not key.startswith("product.")
+        }
+        product = {
+            column.name: row[f"product.{column.name}"] for column in product_columns
+        }
+        item["name"] = product["name"]
+        item["product"] = product if product["id"] is not None else None
+        invoice["items"].append(item)
+    return list(invoices.values())
+
+
+async def get_products_by_id(db: AsyncSession, product_ids):
+    """Load the given products with one IN query, keyed by id.
+
+    Raises a 400 naming every requested id that doesn't exist.
+    """
+    products = await db.scalars(select(DBProduct).where(DBProduct.id.in_(product_ids)))
+    products = {product.id: product for product in products}
+    missing = sorted(set(product_ids) - products.keys())
+    if len(missing) == 1:
+        raise HTTPException(
+            status_code=400, detail=f"Product with id {missing[0]} not found"
+        )
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Products with ids {', '.join(map(str, missing))} not found",
+        )
+    return products
+
+
+async def get_customer_or_400(db: AsyncSession, customer_id: int):
+    # SQLite doesn't enforce the foreign key, so it is checked here
+    customer = await db.scalar(CUSTOMER_BY_ID, {"customer_id": customer_id})
+    if customer is None:
+        raise HTTPException(
+            status_code=400, detail=f"Customer with id {customer_id} not found"
+        )
+    return customer
+
+
+def is_duplicate_invoice_number(error: IntegrityError) -> bool:
+    # Only the UNIQUE index on invoice_number maps to a client error; other
+    # constraint failures are left to surface as they are.
+    return "UNIQUE constraint failed: invoices.invoice_number" in str(error.orig)
+
+
+def invoice_subtotal(invoice_id: int):
+    return select(func.coalesce(func.sum(DBInvoiceItem.total), 0.0)).where(
+        DBInvoiceItem.invoice_id == invoice_id
+    )
+
+
+# Amounts the server works out from the items; values sent by the client for
+# these are ignored.
+DERIVED_INVOICE_FIELDS = {"subtotal", "discount_amount", "tax_amount", "total_amount"}
+
+
+def invoice_totals(
+    subtotal: float,
+    discount_type: Optional[str],
+    discount_value: Optional[float],
+    tax_percent: float,
+    timbre: float,
+) -> dict[str, float]:
+    discount_value = discount_value or 0.0
+    if discount_type == "percent":
+        discount_amount = subtotal * discount_value / 100
+    else:
+        discount_amount = discount_value
+    taxable = subtotal - discount_amount
+    tax_amount = taxable * tax_percent / 100
+    return {
+        "subtotal": round(subtotal, 2),
+        "discount_amount": round(discount_amount, 2),
+        "tax_amount": round(tax_amount, 2),
+        "total_amount": round(taxable + tax_amount + timbre, 2),
+    }
+
+
+# Verified tokens map to their (detached) user for a short while, which
+# saves the JWT decode and the users SELECT on every authenticated request.
+AUTH_CACHE_TTL_SECONDS = 60
+AUTH_CACHE_MAX_SIZE = 10_000
+_auth_cache: dict[str, tuple[DBUser, float]] = {}
+_auth_cache_lock = threading.Lock()
+
+
+def _cached_user(token: str):
+    with _auth_cache_lock:
+        entry = _auth_cache.get(token)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if expires_at <= time.time():
+            del _auth_cache[token]
+            return None
+        return user
+
+
+def _cache_user(token: str, user: DBUser, token_exp: float):
+    now = time.time()
+    with _auth_cache_lock:
+        if len(_auth_cache) >= AUTH_CACHE_MAX_SIZE:
+            for key in [k for k, (_, exp) in _auth_cache.items() if exp <= now]:
+                del _auth_cache[key]
+            if len(_auth_cache) >= AUTH_CACHE_MAX_SIZE:
+                _auth_cache.clear()
+        _auth_cache[token] = (user, min(now + AUTH_CACHE_TTL_SECONDS, token_exp))
+
+
+def invalidate_cached_user(user_id: int):
+    with _auth_cache_lock:
+        for key in [k for k, (u, _) in _auth_cache.items() if u.id == user_id]:
+            del _auth_cache[key]
 
 
 async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
 ):
+    user = _cached_user(token)
+    if user is not None:
+        return user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -401,60 +850,70 @@ async def get_current_user(
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-    except JWTError:
+    except InvalidTokenError:
         raise credentials_exception
-    user = get_user_by_username(db, username=username)
+    user = await get_user_by_username(db, username=username)
     if user is None:
         raise credentials_exception
+    _cache_user(token, user, payload.get("exp", 0))
     return user
 
 
 @app.post("/register/", response_model=UserOut)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = get_user_by_username(db, user.username)
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await get_user_by_username(db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await asyncio.to_thread(get_password_hash, user.password)
     db_user = DBUser(
         username=user.username, email=user.email, hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     return db_user
 
 
 @app.post("/login/")
-def login(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = get_user_by_username(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await get_user_by_username(db, form_data.username)
+    if not user or not await asyncio.to_thread(
+        verify_password, form_data.password, user.hashed_password
+    ):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
     # Only allow active accounts to log in!
     if not user.is_active:
         raise HTTPException(status_code=403, detail="User account not activated")
 
+    if pwd_context.needs_update(user.hashed_password):
+        user.hashed_password = await asyncio.to_thread(
+            get_password_hash, form_data.password
+        )
+        await db.commit()
+
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @app.put("/users/{user_id}/activate")
-def activate_user(
+async def activate_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="Only superusers can activate users"
         )
-    user = db.query(DBUser).filter(DBUser.id == user_id).first()
+    user = await db.scalar(USER_BY_ID, {"user_id": user_id})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     user.is_active = True
-    db.commit()
+    await db.commit()
+    invalidate_cached_user(user_id)
     return {"detail": "User activated."}
 
 
@@ -464,23 +923,22 @@ def activate_user(
 @app.post("/products/", response_model=Product)
 async def create_product(
     product: ProductCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
     db_product = DBProduct(**product.model_dump())
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
     return db_product
 
 
 @app.get("/products/{product_id}", response_model=Product)
 async def read_product(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
+    db_product = await db.scalar(PRODUCT_BY_ID, {"product_id": product_id})
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     return db_product
@@ -488,40 +946,45 @@ async def read_product(
 
 @app.get("/products/", response_model=List[Product])
 async def list_products(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    return db.query(DBProduct).all()
+    return (await db.scalars(select(DBProduct))).all()
 
 
 @app.put("/products/{product_id}", response_model=Product)
 async def update_product(
     product_id: int,
     product: ProductUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
+    values = product.model_dump(exclude_unset=True)
+    if values:
+        db_product = await db.scalar(
+            update(DBProduct)
+            .where(DBProduct.id == product_id)
+            .values(**values)
+            .returning(DBProduct)
+        )
+    else:
+        db_product = await db.scalar(PRODUCT_BY_ID, {"product_id": product_id})
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    for field, value in product.model_dump(exclude_unset=True).items():
-        setattr(db_product, field, value)
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
     return db_product
 
 
 @app.delete("/products/{product_id}")
 async def delete_product(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
-    if db_product is None:
+    result = await db.execute(delete(DBProduct).where(DBProduct.id == product_id))
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Product not found")
-    db.delete(db_product)
-    db.commit()
+    await db.commit()
     return {"message": "Product deleted successfully"}
 
 
@@ -529,23 +992,22 @@ async def delete_product(
 @app.post("/customers/", response_model=Customer)
 async def create_customer(
     customer: CustomerCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
     db_customer = DBCustomer(**customer.model_dump())
     db.add(db_customer)
-    db.commit()
-    db.refresh(db_customer)
+    await db.commit()
     return db_customer
 
 
 @app.get("/customers/{customer_id}", response_model=Customer)
 async def read_customer(
     customer_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_customer = db.query(DBCustomer).filter(DBCustomer.id == customer_id).first()
+    db_customer = await db.scalar(CUSTOMER_BY_ID, {"customer_id": customer_id})
     if db_customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
     return db_customer
@@ -553,40 +1015,45 @@ async def read_customer(
 
 @app.get("/customers/", response_model=List[Customer])
 async def list_customers(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    return db.query(DBCustomer).all()
+    return (await db.scalars(select(DBCustomer))).all()
 
 
 @app.put("/customers/{customer_id}", response_model=Customer)
 async def update_customer(
     customer_id: int,
     customer: CustomerUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_customer = db.query(DBCustomer).filter(DBCustomer.id == customer_id).first()
+    values = customer.model_dump(exclude_unset=True)
+    if values:
+        db_customer = await db.scalar(
+            update(DBCustomer)
+            .where(DBCustomer.id == customer_id)
+            .values(**values)
+            .returning(DBCustomer)
+        )
+    else:
+        db_customer = await db.scalar(CUSTOMER_BY_ID, {"customer_id": customer_id})
     if db_customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
-    for field, value in customer.model_dump(exclude_unset=True).items():
-        setattr(db_customer, field, value)
-    db.commit()
-    db.refresh(db_customer)
+    await db.commit()
     return db_customer
 
 
 @app.delete("/customers/{customer_id}")
 async def delete_customer(
     customer_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_customer = db.query(DBCustomer).filter(DBCustomer.id == customer_id).first()
-    if db_customer is None:
+    result = await db.execute(delete(DBCustomer).where(DBCustomer.id == customer_id))
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Customer not found")
-    db.delete(db_customer)
-    db.commit()
+    await db.commit()
     return {"message": "Customer deleted successfully"}
 
 
@@ -594,26 +1061,32 @@ async def delete_customer(
 @app.post("/settings/", response_model=Setting)
 async def create_setting(
     setting: SettingCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
+    if setting.key in INTERNAL_SETTING_KEYS:
+        raise HTTPException(status_code=400, detail="Key is reserved")
     db_setting = DBSetting(**setting.model_dump())
     db.add(db_setting)
     try:
-        db.commit()
-        db.refresh(db_setting)
+        await db.commit()
+        invalidate_setting(db_setting.key)
         return db_setting
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Key already exists")
 
 
 @app.get("/settings/", response_model=List[Settings])
 async def read_settings(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_settings = db.query(DBSetting).all()
+    db_settings = (
+        await db.scalars(
+            select(DBSetting).where(DBSetting.key.not_in(INTERNAL_SETTING_KEYS))
+        )
+    ).all()
     if db_settings is None:
         raise HTTPException(status_code=404, detail="Settings not found")
     return db_settings
@@ -622,10 +1095,12 @@ async def read_settings(
 @app.get("/settings/{key}", response_model=Setting)
 async def read_setting(
     key: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_setting = db.query(DBSetting).filter(DBSetting.key == key).first()
+    if key in INTERNAL_SETTING_KEYS:
+        raise HTTPException(status_code=404, detail="Setting not found")
+    db_setting = await db.scalar(SETTING_BY_KEY, {"key": key})
     if db_setting is None:
         raise HTTPException(status_code=404, detail="Setting not found")
     return db_setting
@@ -635,15 +1110,21 @@ async def read_setting(
 async def update_setting(
     key: str,
     setting: SettingCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_setting = db.query(DBSetting).filter(DBSetting.key == key).first()
+    if key in INTERNAL_SETTING_KEYS:
+        raise HTTPException(status_code=404, detail="Setting not found")
+    db_setting = await db.scalar(
+        update(DBSetting)
+        .where(DBSetting.key == key)
+        .values(value=setting.value)
+        .returning(DBSetting)
+    )
     if db_setting is None:
         raise HTTPException(status_code=404, detail="Setting not found")
-    db_setting.value = setting.value
-    db.commit()
-    db.refresh(db_setting)
+    await db.commit()
+    invalidate_setting(key)
     return db_setting
 
 
@@ -651,237 +1132,448 @@ async def update_setting(
 @app.post("/invoices/", response_model=Invoice)
 async def create_invoice(
     invoice_data: InvoiceCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    print(invoice_data)
-    for item_data in invoice_data.items:
-        product = (
-            db.query(DBProduct).filter(DBProduct.id == item_data.product_id).first()
-        )
-        if not product:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Product with id {item_data.product_id} not found",
-            )
+    logger.debug("create_invoice payload: %s", invoice_data)
+    customer = await get_customer_or_400(db, invoice_data.customer_id)
+    products = await get_products_by_id(
+        db, {item_data.product_id for item_data in invoice_data.items}
+    )
 
     db_invoice = DBInvoice(
         invoice_number=invoice_data.invoice_number,
         invoice_date=invoice_data.invoice_date,
         due_date=invoice_data.due_date,
         customer_id=invoice_data.customer_id,
-        subtotal=invoice_data.subtotal,
+        subtotal=0.0,
         discount_type=invoice_data.discount_type,
         discount_value=invoice_data.discount_value,
-        discount_amount=invoice_data.discount_amount,
         tax_percent=invoice_data.tax_percent,
-        tax_amount=invoice_data.tax_amount,
+        tax_amount=0.0,
         timbre=invoice_data.timbre,
-        total_amount=invoice_data.total_amount,
+        total_amount=0.0,
         notes=invoice_data.notes,
     )
 
-    db.add(db_invoice)
-    db.commit()
-    db.refresh(db_invoice)
-
-    for item_data in invoice_data.items:
-        product = (
-            db.query(DBProduct).filter(DBProduct.id == item_data.product_id).first()
-        )
-        unit_price = (
-            item_data.unit_price
-            if item_data.unit_price is not None
-            else product.unit_price
-        )
-        item_total = item_data.quantity * unit_price
-        db_invoice_item = DBInvoiceItem(
-            invoice_id=db_invoice.id,
+    # The items are attached to the invoice so one flush writes both.
+    db_invoice.items = db_invoice_items = [
+        DBInvoiceItem(
             product_id=item_data.product_id,
             description=item_data.description,
-            unit_price=unit_price,
+            unit_price=(
+                item_data.unit_price
+                if item_data.unit_price is not None
+                else products[item_data.product_id].unit_price
+            ),
             quantity=item_data.quantity,
-            total=item_total,
         )
-        db.add(db_invoice_item)
-    db.commit()
-    db.refresh(db_invoice)
-    return db_invoice
+        for item_data in invoice_data.items
+    ]
+
+    db.add(db_invoice)
+    try:
+        await db.flush()
+    except IntegrityError as e:
+        await db.rollback()
+        if not is_duplicate_invoice_number(e):
+            raise
+        raise HTTPException(status_code=400, detail="Invoice number already exists")
+    totals = invoice_totals(
+        await db.scalar(invoice_subtotal(db_invoice.id)),
+        db_invoice.discount_type,
+        db_invoice.discount_value,
+        db_invoice.tax_percent,
+        db_invoice.timbre,
+    )
+    for field, value in totals.items():
+        setattr(db_invoice, field, value)
+    await db.commit()
+
+    # The response is assembled from the rows just written and the products
+    # already loaded, instead of reloading the invoice tree.
+    response = schema_dict(Invoice, db_invoice)
+    response["customer"] = schema_dict(Customer, customer)
+    response["items"] = []
+    for db_invoice_item in db_invoice_items:
+        product = products[db_invoice_item.product_id]
+        item = schema_dict(InvoiceItem, db_invoice_item)
+        item["name"] = product.name
+        item["product"] = schema_dict(Product, product)
+        response["items"].append(item)
+    return response
 
 
 @app.get("/invoices/{invoice_id}", response_model=Invoice)
 async def read_invoice(
     invoice_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_invoice = (
-        db.query(DBInvoice)
-        .options(joinedload(DBInvoice.items).joinedload(DBInvoiceItem.product))
-        .filter(DBInvoice.id == invoice_id)
-        .first()
-    )
+    db_invoice = await get_invoice_with_items(db, invoice_id)
     if db_invoice is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    invoice = Invoice.from_orm(db_invoice)
-    invoice.items = [InvoiceItem.from_orm(item) for item in db_invoice.items]
-    for i, item in enumerate(db_invoice.items):
-        invoice.items[i].name = item.product.name if item.product else None
-    return invoice
+    return Invoice.model_validate(db_invoice)
 
 
 @app.get("/invoices/", response_model=List[Invoice])
 async def list_invoices(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    invoices = (
-        db.query(DBInvoice)
-        .options(joinedload(DBInvoice.items).joinedload(DBInvoiceItem.product))
-        .all()
-    )
-    invoice_list = []
-    for db_invoice in invoices:
-        invoice = Invoice.from_orm(db_invoice)
-        invoice.items = [InvoiceItem.from_orm(item) for item in db_invoice.items]
-        for i, item in enumerate(db_invoice.items):
-            invoice.items[i].name = item.product.name if item.product else None
-        invoice_list.append(invoice)
-    return invoice_list
+    return await list_invoice_rows(db)
 
 
 @app.put("/invoices/{invoice_id}", response_model=Invoice)
 async def update_invoice(
     invoice_id: int,
     invoice: InvoiceUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
 ):
-    db_invoice = (
-        db.query(DBInvoice)
-        .options(joinedload(DBInvoice.items))
-        .filter(DBInvoice.id == invoice_id)
-        .first()
+    logger.debug("update_invoice discount_amount: %s", invoice.discount_amount)
+    # Only the fields the client sent are written.
+    values = invoice.model_dump(
+        exclude={"items", *DERIVED_INVOICE_FIELDS}, exclude_unset=True
     )
-
-    if db_invoice is None:
+    if values.get("customer_id") is not None:
+        await get_customer_or_400(db, values["customer_id"])
+    # Nothing is committed until the end, so a later 400 rolls this back.
+    if values:
+        try:
+            updated_id = await db.scalar(
+                update(DBInvoice)
+                .where(DBInvoice.id == invoice_id)
+                .values(**values)
+                .returning(DBInvoice.id)
+                .execution_options(synchronize_session=False)
+            )
+        except IntegrityError as e:
+            await db.rollback()
+            if not is_duplicate_invoice_number(e):
+                raise
+            raise HTTPException(status_code=400, detail="Invoice number already exists")
+    else:
+        updated_id = await db.scalar(
+            select(DBInvoice.id).where(DBInvoice.id == invoice_id)
+        )
+    if updated_id is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    for field, value in invoice.model_dump(
-        exclude={"items"}, exclude_unset=True
-    ).items():
-        setattr(db_invoice, field, value)
-
     if invoice.items is not None:
-        for item in db_invoice.items:
-            db.delete(item)
-        db.commit()
-        db_invoice.items.clear()
-
         for item_data in invoice.items:
             if item_data.product_id is None or item_data.quantity is None:
                 raise HTTPException(
                     status_code=400,
                     detail="Product_id and quantity Cannot be None on create",
                 )
-            product = (
-                db.query(DBProduct).filter(DBProduct.id == item_data.product_id).first()
-            )
-            if not product:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Product with id {item_data.product_id} not found",
-                )
+        products = await get_products_by_id(
+            db, {item_data.product_id for item_data in invoice.items}
+        )
+
+        await db.execute(
+            delete(DBInvoiceItem)
+            .where(DBInvoiceItem.invoice_id == invoice_id)
+            .execution_options(synchronize_session=False)
+        )
+
+        db_invoice_items = []
+        for item_data in invoice.items:
             unit_price = (
                 item_data.unit_price
                 if item_data.unit_price is not None
-                else product.unit_price
+                else products[item_data.product_id].unit_price
             )
-            item_total = item_data.quantity * unit_price
-            db_invoice_item = DBInvoiceItem(
-                invoice_id=db_invoice.id,
-                product_id=item_data.product_id,
-                description=item_data.description,
-                unit_price=unit_price,
-                quantity=item_data.quantity,
-                total=item_total,
+            db_invoice_items.append(
+                DBInvoiceItem(
+                    invoice_id=invoice_id,
+                    product_id=item_data.product_id,
+                    description=item_data.description,
+                    unit_price=unit_price,
+                    quantity=item_data.quantity,
+                )
             )
-            db.add(db_invoice_item)
-            db_invoice.items.append(db_invoice_item)
-    print("***", invoice.discount_amount)
-    db_invoice.subtotal = invoice.subtotal
-    db_invoice.discount_amount = invoice.discount_amount
-    db_invoice.tax_amount = invoice.tax_amount
-    db_invoice.total_amount = invoice.total_amount
-    db.commit()
-    db.refresh(db_invoice)
-    return db_invoice
+        db.add_all(db_invoice_items)
+        await db.flush()
+
+    subtotal = await db.scalar(invoice_subtotal(invoice_id))
+    row = (
+        await db.execute(
+            select(
+                DBInvoice.discount_type,
+                DBInvoice.discount_value,
+                DBInvoice.tax_percent,
+                DBInvoice.timbre,
+            ).where(DBInvoice.id == invoice_id)
+        )
+    ).one()
+    await db.execute(
+        update(DBInvoice)
+        .where(DBInvoice.id == invoice_id)
+        .values(**invoice_totals(subtotal, *row))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return await get_invoice_with_items(db, invoice_id)
 
 
 # --- Invoice Generation ---
 
+# PDF rendering is CPU bound, so it runs in a process pool started with the app.
+# Every app worker process gets its own pool, so the default stays small.
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", "2"))
+PDF_LOGO_PATH = "logo.png"
+pdf_render_pool = None
+
+# Rendered PDFs are kept on disk as <invoice_id>-<version>.pdf so every
+# worker process sees them. A queued render is marked by a .pending file and
+# a failed one leaves its error in a .failed file.
+PDF_CACHE_DIR = os.environ.get(
+    "PDF_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf_cache"),
+)
+# A render still pending after this long is treated as abandoned
+PDF_RENDER_TIMEOUT_SECONDS = 300
+
+# company_data field -> settings key
+COMPANY_SETTING_KEYS = {
+    "name": "company_name",
+    "address": "company_address",
+    "phone": "company_telephone",
+    "email": "company_email",
+    "footer_text": "footer_text",
+}
+
+
+def _new_pdf_render_pool():
+    return create_render_pool(
+        [PDF_LOGO_PATH], PDF_RENDER_WORKERS, multiprocessing.get_context("spawn")
+    )
 
-@app.post("/generate_invoice/{invoice_id}")
-async def generate_invoice(
-    invoice_id: int,
-    db: Session = Depends(get_db),
-    current_user: DBUser = Depends(get_current_user),
-):
-    try:
-        db_invoice = db.query(DBInvoice).filter(DBInvoice.id == invoice_id).first()
-        if not db_invoice:
-            raise HTTPException(status_code=404, detail="Invoice not found")
 
-        company_name = (
-            db.query(DBSetting).filter(DBSetting.key == "company_name").first().value
+async def start_pdf_render_pool():
+    global pdf_render_pool
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    pdf_render_pool = _new_pdf_render_pool()
+    # Start every worker now so the first render doesn't pay for it
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *(
+            loop.run_in_executor(pdf_render_pool, os.getpid)
+            for _ in range(PDF_RENDER_WORKERS)
         )
+    )
 
-        company_address = (
-            db.query(DBSetting).filter(DBSetting.key == "company_address").first().value
-        )
 
-        company_telephone = (
-            db.query(DBSetting)
-            .filter(DBSetting.key == "company_telephone")
-            .first()
-            .value
-        )
-        company_email = (
-            db.query(DBSetting).filter(DBSetting.key == "company_email").first().value
-        )
+async def build_pdf_job(db: AsyncSession, invoice_id: int):
+    """Collect what is needed to render an invoice.
 
-        footer_text = (
-            db.query(DBSetting).filter(DBSetting.key == "footer_text").first().value
+    Returns the invoice, the render job and a version string that changes
+    whenever the invoice or the company settings do.
+    """
+    db_invoice = await get_invoice_with_items(db, invoice_id)
+    if not db_invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+
+    keys = list(COMPANY_SETTING_KEYS.values())
+    settings_map = await get_settings(db, keys)
+    missing = [key for key in keys if key not in settings_map]
+    if missing:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Missing required settings: {', '.join(missing)}",
         )
 
-        invoice = Invoice.from_orm(db_invoice)
-        company_data = {
-            "name": company_name,
-            "address": company_address,
-            "phone": company_telephone,
-            "email": company_email,
-            "footer_text": footer_text,
-        }
+    invoice = Invoice.model_validate(db_invoice)
+    company_data = {
+        field: settings_map[key] for field, key in COMPANY_SETTING_KEYS.items()
+    }
+    invoice_data = invoice.model_dump()
+    version = hashlib.sha256(
+        json.dumps([invoice_data, company_data]).encode()
+    ).hexdigest()
+
+    # Rendered in memory; nothing is written to disk.
+    job = {
+        "filename": None,
+        "logo_path": PDF_LOGO_PATH,
+        "invoice_data": invoice_data,
+        "company_data": company_data,
+    }
+    return invoice, job, version[:16]
 
-        file_name = f"{invoice.invoice_number}.pdf"
 
-        invoice_generator = ProfessionalInvoice(
-            file_name, "logo.png", invoice.model_dump(), company_data
-        )
+def pdf_cache_path(invoice_id: int, version: str, suffix: str = ".pdf"):
+    return os.path.join(PDF_CACHE_DIR, f"{invoice_id}-{version}{suffix}")
 
-        invoice_generator.generate_invoice()
 
-        return FileResponse(
-            path=file_name,
-            filename=file_name,  # Set the desired filename for the download
-            media_type="octet-stream",  # Specify the correct MIME type
-        )
+def read_cached_pdf(invoice_id: int, version: str):
+    try:
+        with open(pdf_cache_path(invoice_id, version), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def store_pdf(invoice_id: int, version: str, pdf: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=PDF_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(pdf)
+    os.replace(tmp_path, pdf_cache_path(invoice_id, version))
+    # Earlier versions of this invoice can't be requested any more
+    current = f"{invoice_id}-{version}"
+    for name in os.listdir(PDF_CACHE_DIR):
+        if (
+            name.startswith(f"{invoice_id}-")
+            and not name.startswith(current)
+            and name.endswith((".pdf", ".failed"))
+        ):
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(PDF_CACHE_DIR, name))
+
+
+def claim_pdf_render(invoice_id: int, version: str) -> bool:
+    """Mark a render as pending unless another request already did."""
+    pending = pdf_cache_path(invoice_id, version, ".pending")
+    try:
+        os.close(os.open(pending, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        if pdf_render_pending(invoice_id, version):
+            return False
+        os.utime(pending)
+    with suppress(FileNotFoundError):
+        os.remove(pdf_cache_path(invoice_id, version, ".failed"))
+    return True
+
+
+def pdf_render_pending(invoice_id: int, version: str) -> bool:
+    try:
+        started = os.path.getmtime(pdf_cache_path(invoice_id, version, ".pending"))
+    except FileNotFoundError:
+        return False
+    return time.time() - started < PDF_RENDER_TIMEOUT_SECONDS
 
+
+def pdf_render_error(invoice_id: int, version: str):
+    try:
+        with open(pdf_cache_path(invoice_id, version, ".failed")) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+async def render_pdf(invoice_id: int, job: dict, version: str):
+    pdf = read_cached_pdf(invoice_id, version)
+    if pdf is not None:
+        return pdf
+    global pdf_render_pool
+    loop = asyncio.get_running_loop()
+    pool = pdf_render_pool
+    try:
+        pdf = await loop.run_in_executor(pool, render_job, job)
+    except BrokenProcessPool:
+        # A worker died and took the pool with it; replace it and retry once
+        if pdf_render_pool is pool:
+            logger.warning("PDF render pool broke; starting a new one")
+            pdf_render_pool = _new_pdf_render_pool()
+            pool.shutdown(wait=False)
+        pdf = await loop.run_in_executor(pdf_render_pool, render_job, job)
+    await asyncio.to_thread(store_pdf, invoice_id, version, pdf)
+    return pdf
+
+
+async def render_pdf_in_background(invoice_id: int, job: dict, version: str):
+    try:
+        await render_pdf(invoice_id, job, version)
+    except Exception as e:
+        logger.exception("Rendering the PDF of invoice %s failed", invoice_id)
+        with open(pdf_cache_path(invoice_id, version, ".failed"), "w") as f:
+            f.write(str(e) or type(e).__name__)
+    finally:
+        with suppress(FileNotFoundError):
+            os.remove(pdf_cache_path(invoice_id, version, ".pending"))
+
+
+def attachment_disposition(file_name: str):
+    # Same rule as Starlette's FileResponse: names that survive quoting
+    # unchanged go in filename=, anything else as RFC 5987 filename*=.
+    quoted = quote(file_name, safe="")
+    if quoted != file_name:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{file_name}"'
+
+
+def pdf_response(invoice: Invoice, pdf: bytes):
+    file_name = f"{invoice.invoice_number}.pdf"
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": attachment_disposition(file_name)},
+    )
+
+
+@app.post("/generate_invoice/{invoice_id}")
+async def generate_invoice(
+    invoice_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: DBUser = Depends(get_current_user),
+):
+    try:
+        invoice, job, version = await build_pdf_job(db, invoice_id)
+        return pdf_response(invoice, await render_pdf(invoice_id, job, version))
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/invoices/{invoice_id}/pdf", status_code=status.HTTP_202_ACCEPTED)
+async def queue_invoice_pdf(
+    invoice_id: int,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: DBUser = Depends(get_current_user),
+):
+    """Queue a render; poll the Location URL for the result.
+
+    The job id is the invoice version, so it keeps pointing at this render
+    after the invoice changes, until a newer version has been rendered.
+    """
+    invoice, job, version = await build_pdf_job(db, invoice_id)
+    response.headers["Location"] = f"/invoices/{invoice_id}/pdf?job_id={version}"
+    if os.path.exists(pdf_cache_path(invoice_id, version)):
+        return {"job_id": version, "status": "ready"}
+    if claim_pdf_render(invoice_id, version):
+        background_tasks.add_task(render_pdf_in_background, invoice_id, job, version)
+    return {"job_id": version, "status": "rendering"}
+
+
+@app.get("/invoices/{invoice_id}/pdf")
+async def read_invoice_pdf(
+    invoice_id: int,
+    job_id: Optional[str] = Query(default=None, pattern="^[0-9a-f]{16}$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: DBUser = Depends(get_current_user),
+):
+    invoice, job, version = await build_pdf_job(db, invoice_id)
+    # Without a job id the current version of the invoice is served
+    version = job_id or version
+    pdf = read_cached_pdf(invoice_id, version)
+    if pdf is not None:
+        return pdf_response(invoice, pdf)
+    if pdf_render_pending(invoice_id, version):
+        raise HTTPException(status_code=409, detail="Invoice PDF is still rendering")
+    error = pdf_render_error(invoice_id, version)
+    if error is not None:
+        raise HTTPException(
+            status_code=500, detail=f"Rendering the invoice PDF failed: {error}"
+        )
+    raise HTTPException(status_code=404, detail="Invoice PDF has not been generated")
+
+
 @app.get("/")
 async def read_root():
     return {"message": "Invoice Generator V1.0"}
@@ -1,19 +1,80 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from fastapi import FastAPI, HTTPException, Response
 from docxtpl import DocxTemplate, InlineImage
 from docx.shared import Mm
 from pydantic import BaseModel
 import jinja2
 from datetime import datetime
+from functools import lru_cache
+import io
+from urllib.parse import quote
 
 
+@lru_cache(maxsize=1024)
 def format_date(value, format="%d-%m-%Y"):
     """Custom filter for date formatting.  Handles string inputs."""
+    # The default DD-MM-YYYY output is just the YYYY-MM-DD input reordered,
+    # once datetime() has checked it is a real date. Anything else goes
+    # through strptime, which raises for invalid input as before.
+    if (
+        format == "%d-%m-%Y"
+        and len(value) == 10
+        and value.isascii()
+        and value[4] == value[7] == "-"
+        and value[:4].isdigit()
+        and value[5:7].isdigit()
+        and value[8:10].isdigit()
+    ):
+        try:
+            datetime(int(value[:4]), int(value[5:7]), int(value[8:10]))
+        except ValueError:
+            pass
+        else:
+            return f"{value[8:10]}-{value[5:7]}-{value[:4]}"
     date = datetime.strptime(value, "%Y-%m-%d")
     return date.strftime(format)
 
 
+class CachingEnvironment(jinja2.Environment):
+    """Environment that compiles each template source only once.
+
+    DocxTemplate passes the same document XML to from_string() on every
+    render, so the compiled template is kept and reused.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._compiled = {}
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals is not None or template_class is not None:
+            return super().from_string(source, globals, template_class)
+        template = self._compiled.get(source)
+        if template is None:
+            template = self._compiled[source] = super().from_string(source)
+        return template
+
+
+class CachedDocxTemplate(DocxTemplate):
+    """DocxTemplate that reuses the cleaned-up XML of a previous render."""
+
+    _patched_xml = {}
+
+    def patch_xml(self, src_xml):
+        patched = self._patched_xml.get(src_xml)
+        if patched is None:
+            patched = self._patched_xml[src_xml] = super().patch_xml(src_xml)
+        return patched
+
+
+@lru_cache(maxsize=None)
+def read_template(path):
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
 # Create a Jinja2 environment and add the filter
-jinja_env = jinja2.Environment(
+jinja_env = CachingEnvironment(
     extensions=[], trim_blocks=True, lstrip_blocks=True
 )  # DocxTemplate defaults
 jinja_env.filters["dateformat"] = format_date
@@ -49,25 +110,51 @@ class InvoiceData(BaseModel):
 
 invoice_template_path = "template.docx"  # Make sure this file exists
 logo_template_path = "logo.png"  # Make sure this file exists
+DOCX_MEDIA_TYPE = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+)
 
+# The logo is read once; invoices render without it if the file is missing.
+try:
+    with open(logo_template_path, "rb") as fh:
+        logo_bytes = fh.read()
+except OSError:
+    logo_bytes = None
 
-@app.post("/generate_invoice/")
-async def generate_invoice(data: InvoiceData):
-    try:
-        doc = DocxTemplate(invoice_template_path)
-        logo = InlineImage(doc, logo_template_path, width=Mm(40))
 
-        context = data.model_dump()
-        context["logo"] = logo
-        doc.render(context, jinja_env)
+def attachment_disposition(file_name):
+    # Same rule as Starlette's FileResponse: names that survive quoting
+    # unchanged go in filename=, anything else as RFC 5987 filename*=.
+    quoted = quote(file_name, safe="")
+    if quoted != file_name:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{file_name}"'
+
 
-        output_file_path = f"generated_invoice_{data.invoice_number}.docx"
-        doc.save(output_file_path)
+def render_invoice(context):
+    doc = CachedDocxTemplate(io.BytesIO(read_template(invoice_template_path)))
+    context["logo"] = (
+        InlineImage(doc, io.BytesIO(logo_bytes), width=Mm(40)) if logo_bytes else ""
+    )
+    doc.render(context, jinja_env)
 
-        return {
-            "filename": output_file_path,
-            "message": "Invoice generated successfully",
-        }
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+@app.post("/generate_invoice/")
+async def generate_invoice(data: InvoiceData):
+    try:
+        # Rendering and zipping are blocking, so they run in a worker thread
+        content = await asyncio.to_thread(render_invoice, data.model_dump())
+
+        file_name = f"generated_invoice_{data.invoice_number}.docx"
+        return Response(
+            content=content,
+            media_type=DOCX_MEDIA_TYPE,
+            headers={"Content-Disposition": attachment_disposition(file_name)},
+        )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,96 @@
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.main opens ./database/invoice_db.db and ./logo.png relative to the
+# working directory and reads its configuration at import time, so all of
+# this has to be in place before it is imported.
+WORK_DIR = tempfile.mkdtemp(prefix="fatoura-tests-")
+os.makedirs(os.path.join(WORK_DIR, "database"))
+shutil.copy(os.path.join(ROOT, "app", "settings", "logo.png"), WORK_DIR)
+os.chdir(WORK_DIR)
+sys.path.insert(0, ROOT)
+os.environ.setdefault("JWT_SECRET", "test-secret-that-is-long-enough-for-hs256")
+os.environ.setdefault("PDF_RENDER_WORKERS", "1")
+os.environ.setdefault("PDF_CACHE_DIR", os.path.join(WORK_DIR, "pdf_cache"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import main  # noqa: E402
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    response = client.post("/login/", data={"username": "admin", "password": "admin"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def customer(client, auth_headers):
+    response = client.post(
+        "/customers/",
+        json={"name": "Customer", "address": "1 Main Street"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture(scope="session")
+def products(client, auth_headers):
+    created = []
+    for name, unit_price in [("Widget", 10.0), ("Gadget", 25.0)]:
+        response = client.post(
+            "/products/",
+            json={"name": name, "description": name, "unit_price": unit_price},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+        created.append(response.json())
+    return created
+
+
+@pytest.fixture
+def invoice_payload(customer, products):
+    return {
+        "invoice_number": f"INV-{uuid.uuid4().hex[:8]}",
+        "invoice_date": "2025-01-01",
+        "due_date": "2025-02-01",
+        "customer_id": customer["id"],
+        "timbre": 1.0,
+        "tax_percent": 19,
+        "notes": "Thanks",
+        "items": [
+            {"product_id": products[0]["id"], "quantity": 2, "description": "Two"},
+            {
+                "product_id": products[1]["id"],
+                "quantity": 1,
+                "unit_price": 5.0,
+                "description": "Discounted",
+            },
+        ],
+    }
+
+
+@pytest.fixture
+def invoice(client, auth_headers, invoice_payload):
+    response = client.post("/invoices/", json=invoice_payload, headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()
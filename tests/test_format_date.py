@@ -0,0 +1,39 @@
+import pytest
+
+from main1 import format_date
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2025-01-31", "31-01-2025"),
+        ("2024-02-29", "29-02-2024"),
+        ("0001-01-01", "01-01-0001"),
+        ("2025-1-5", "05-01-2025"),
+    ],
+)
+def test_default_format(value, expected):
+    assert format_date(value) == expected
+
+
+def test_custom_format():
+    assert format_date("2025-03-04", "%Y/%m/%d") == "2025/03/04"
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2025-13-01",
+        "2025-00-10",
+        "2025-02-30",
+        "2023-02-29",
+        "0000-01-01",
+        "2025-01-3a",
+        "2025/01/31",
+        "2025-٠١-٣١",
+        "",
+    ],
+)
+def test_invalid_dates_raise(value):
+    with pytest.raises(ValueError):
+        format_date(value)
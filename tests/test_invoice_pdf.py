@@ -0,0 +1,82 @@
+import os
+import time
+
+from app import main
+
+UNKNOWN_JOB_ID = "0123456789abcdef"
+
+
+def pdf_url(invoice, job_id):
+    return f"/invoices/{invoice['id']}/pdf?job_id={job_id}"
+
+
+def test_queued_pdf_can_be_fetched(client, auth_headers, invoice):
+    response = client.post(f"/invoices/{invoice['id']}/pdf", headers=auth_headers)
+
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert response.headers["location"] == pdf_url(invoice, job_id)
+
+    # TestClient returns once the background render has finished
+    response = client.get(response.headers["location"], headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["content-disposition"] == (
+        f'attachment; filename="{invoice["invoice_number"]}.pdf"'
+    )
+    assert response.content.startswith(b"%PDF-")
+
+    again = client.post(f"/invoices/{invoice['id']}/pdf", headers=auth_headers)
+    assert again.json() == {"job_id": job_id, "status": "ready"}
+
+
+def test_pending_render_is_409(client, auth_headers, invoice):
+    pending = main.pdf_cache_path(invoice["id"], UNKNOWN_JOB_ID, ".pending")
+    open(pending, "w").close()
+    try:
+        response = client.get(pdf_url(invoice, UNKNOWN_JOB_ID), headers=auth_headers)
+        assert response.status_code == 409
+
+        # A render pending for too long is treated as abandoned
+        started = time.time() - main.PDF_RENDER_TIMEOUT_SECONDS - 1
+        os.utime(pending, (started, started))
+        response = client.get(pdf_url(invoice, UNKNOWN_JOB_ID), headers=auth_headers)
+        assert response.status_code == 404
+    finally:
+        os.remove(pending)
+
+
+def test_failed_render_is_500(client, auth_headers, invoice):
+    failed = main.pdf_cache_path(invoice["id"], UNKNOWN_JOB_ID, ".failed")
+    with open(failed, "w") as f:
+        f.write("out of paper")
+    try:
+        response = client.get(pdf_url(invoice, UNKNOWN_JOB_ID), headers=auth_headers)
+        assert response.status_code == 500
+        assert "out of paper" in response.json()["detail"]
+    finally:
+        os.remove(failed)
+
+
+def test_unknown_job_is_404(client, auth_headers, invoice):
+    response = client.get(pdf_url(invoice, UNKNOWN_JOB_ID), headers=auth_headers)
+
+    assert response.status_code == 404
+
+
+def test_unknown_invoice_is_404(client, auth_headers):
+    response = client.post("/invoices/999999/pdf", headers=auth_headers)
+
+    assert response.status_code == 404
+
+
+def test_malformed_job_id_is_rejected(client, auth_headers, invoice):
+    response = client.get(pdf_url(invoice, "../../etc/passwd"), headers=auth_headers)
+
+    assert response.status_code == 422
+
+
+def test_non_ascii_filename_uses_rfc5987():
+    assert main.attachment_disposition("Facture-été.pdf") == (
+        "attachment; filename*=utf-8''Facture-%C3%A9t%C3%A9.pdf"
+    )
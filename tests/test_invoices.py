@@ -0,0 +1,113 @@
+import pytest
+
+
+def test_create_invoice_derives_totals(client, auth_headers, invoice_payload):
+    payload = dict(
+        invoice_payload,
+        subtotal=999,
+        discount_amount=999,
+        tax_amount=999,
+        total_amount=999,
+    )
+    response = client.post("/invoices/", json=payload, headers=auth_headers)
+
+    assert response.status_code == 200
+    invoice = response.json()
+    assert invoice["subtotal"] == 25.0
+    assert invoice["discount_amount"] == 0.0
+    assert invoice["tax_amount"] == 4.75
+    assert invoice["total_amount"] == 30.75
+
+
+@pytest.mark.parametrize(
+    "discount_type, discount_value, discount_amount, tax_amount, total_amount",
+    [("percent", 20, 5.0, 3.8, 24.8), ("fixed", 3, 3.0, 4.18, 27.18)],
+)
+def test_create_invoice_applies_discount(
+    client,
+    auth_headers,
+    invoice_payload,
+    discount_type,
+    discount_value,
+    discount_amount,
+    tax_amount,
+    total_amount,
+):
+    payload = dict(
+        invoice_payload, discount_type=discount_type, discount_value=discount_value
+    )
+    response = client.post("/invoices/", json=payload, headers=auth_headers)
+
+    assert response.status_code == 200
+    invoice = response.json()
+    assert invoice["discount_amount"] == discount_amount
+    assert invoice["tax_amount"] == tax_amount
+    assert invoice["total_amount"] == total_amount
+
+
+def test_create_invoice_duplicate_number(client, auth_headers, invoice):
+    payload = {
+        key: invoice[key]
+        for key in ["invoice_number", "invoice_date", "due_date", "customer_id"]
+    }
+    payload.update(timbre=1.0, tax_percent=19, items=[])
+    response = client.post("/invoices/", json=payload, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invoice number already exists"
+
+
+def test_partial_update_keeps_unsent_fields(client, auth_headers, invoice):
+    response = client.put(
+        f"/invoices/{invoice['id']}", json={"notes": "Updated"}, headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    updated = response.json()
+    assert updated["notes"] == "Updated"
+    for key in ["invoice_number", "due_date", "customer_id", "total_amount"]:
+        assert updated[key] == invoice[key]
+    assert [item["id"] for item in updated["items"]] == [
+        item["id"] for item in invoice["items"]
+    ]
+
+
+def test_partial_update_recomputes_totals(client, auth_headers, invoice, products):
+    response = client.put(
+        f"/invoices/{invoice['id']}",
+        json={
+            "tax_percent": 10,
+            "total_amount": 1,
+            "items": [
+                {"product_id": products[1]["id"], "quantity": 4, "description": "Four"}
+            ],
+        },
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    updated = response.json()
+    assert [item["product_id"] for item in updated["items"]] == [products[1]["id"]]
+    assert updated["subtotal"] == 100.0
+    assert updated["tax_amount"] == 10.0
+    assert updated["total_amount"] == 111.0
+    assert updated["notes"] == invoice["notes"]
+
+
+def test_update_missing_invoice(client, auth_headers):
+    response = client.put("/invoices/999999", json={"notes": "x"}, headers=auth_headers)
+
+    assert response.status_code == 404
+
+
+def test_update_with_unknown_product_is_rolled_back(client, auth_headers, invoice):
+    response = client.put(
+        f"/invoices/{invoice['id']}",
+        json={"notes": "Lost", "items": [{"product_id": 999999, "quantity": 1}]},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+
+    current = client.get(f"/invoices/{invoice['id']}", headers=auth_headers).json()
+    assert current["notes"] == invoice["notes"]
+    assert len(current["items"]) == len(invoice["items"])
@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine, text
+
+from app import main
+
+OLD_INVOICE_ITEMS = """
+CREATE TABLE invoice_items (
+    id INTEGER PRIMARY KEY,
+    invoice_id INTEGER,
+    product_id INTEGER,
+    description VARCHAR,
+    unit_price FLOAT,
+    quantity INTEGER NOT NULL,
+    total FLOAT
+)
+"""
+
+
+def total_column(conn):
+    columns = conn.exec_driver_sql("PRAGMA table_xinfo(invoice_items)").all()
+    return next(column for column in columns if column[1] == "total")
+
+
+def test_item_totals_become_generated():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(OLD_INVOICE_ITEMS)
+        conn.exec_driver_sql(
+            "CREATE INDEX ix_invoice_items_product_id ON invoice_items (product_id)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO invoice_items VALUES"
+            " (1, 1, 1, 'first', 10.0, 2, 0.0), (2, 1, 2, NULL, 2.5, 3, 99.0)"
+        )
+
+        main.migrate_invoice_item_totals(conn)
+
+        assert total_column(conn)[6] == 3
+        rows = conn.execute(
+            text("SELECT id, description, quantity, total FROM invoice_items")
+        ).all()
+        assert rows == [(1, "first", 2, 20.0), (2, None, 3, 7.5)]
+        indexes = {
+            row[1] for row in conn.exec_driver_sql("PRAGMA index_list(invoice_items)")
+        }
+        assert {index.name for index in main.DBInvoiceItem.__table__.indexes} <= (
+            indexes
+        )
+        assert "invoice_items_old" not in engine.dialect.get_table_names(conn)
+
+
+def test_current_table_is_left_alone():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        main.DBInvoiceItem.__table__.create(conn)
+        conn.exec_driver_sql(
+            "INSERT INTO invoice_items (id, quantity, unit_price) VALUES (1, 2, 3.0)"
+        )
+
+        main.migrate_invoice_item_totals(conn)
+
+        assert total_column(conn)[6] == 3
+        assert conn.execute(text("SELECT total FROM invoice_items")).scalar() == 6.0
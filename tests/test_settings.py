@@ -0,0 +1,69 @@
+import asyncio
+import sqlite3
+
+from app import main
+
+
+def queue_pdf(client, auth_headers, invoice_id):
+    response = client.post(f"/invoices/{invoice_id}/pdf", headers=auth_headers)
+    assert response.status_code == 202
+    return response.json()["job_id"]
+
+
+def test_settings_are_served_from_cache(client, auth_headers, invoice):
+    job_id = queue_pdf(client, auth_headers, invoice["id"])
+
+    # A write that bypasses the API isn't seen until the entry expires
+    with sqlite3.connect("database/invoice_db.db") as conn:
+        conn.execute(
+            "UPDATE settings SET value = 'Changed outside' WHERE key = 'company_name'"
+        )
+    try:
+        assert queue_pdf(client, auth_headers, invoice["id"]) == job_id
+    finally:
+        main.invalidate_setting("company_name")
+
+
+def test_setting_update_invalidates_cache(client, auth_headers, invoice):
+    job_id = queue_pdf(client, auth_headers, invoice["id"])
+
+    response = client.put(
+        "/settings/company_name",
+        json={"key": "company_name", "value": "Renamed Ltd"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+
+    assert queue_pdf(client, auth_headers, invoice["id"]) != job_id
+
+
+class InvalidatedDuringRead:
+    """Session stand-in whose query races with a settings update."""
+
+    async def execute(self, statement):
+        main.invalidate_setting("company_name")
+        return self
+
+    def all(self):
+        return [("company_name", "Old name")]
+
+
+def test_stale_read_does_not_refill_cache():
+    main.invalidate_setting("company_name")
+
+    settings = asyncio.run(main.get_settings(InvalidatedDuringRead(), ["company_name"]))
+
+    assert settings == {"company_name": "Old name"}
+    assert "company_name" not in main._settings_cache
+
+
+def test_internal_settings_are_hidden(client, auth_headers):
+    response = client.get("/settings/", headers=auth_headers)
+
+    assert response.status_code == 200
+    keys = {setting["key"] for setting in response.json()}
+    assert "company_name" in keys
+    assert keys.isdisjoint(main.INTERNAL_SETTING_KEYS)
+    for key in main.INTERNAL_SETTING_KEYS:
+        response = client.get(f"/settings/{key}", headers=auth_headers)
+        assert response.status_code == 404